@@ -5,8 +5,166 @@ from PyQt5.QtWidgets import (QMainWindow, QFileDialog, QApplication,
                             QLabel, QFrame, QColorDialog, QSlider, QButtonGroup,
                             QShortcut, QSizePolicy, QScrollArea)
 
+from Navigator import ImageProxy
+from RenderThread import RenderThread
+from Resampler import Resample
+from ImageHandler import ImageHandler
+from VectorLayer import VectorLayer, paintStrokes
+
+# Document color modes and the QImage format each one is stored in
+COLOR_MODES = {
+    "rgb": QImage.Format_RGB32,
+    "grayscale": QImage.Format_Grayscale8,
+    "lineart": QImage.Format_Mono,
+    "indexed": QImage.Format_Indexed8,
+}
+
+# Index 0 is white in both tables so QImage.fill(Qt.white) clears to paper
+LINEART_PALETTE = [QColor(Qt.white).rgb(), QColor(Qt.black).rgb()]
+INDEXED_PALETTE = [QColor(name).rgb() for name in [
+    "#ffffff", "#000000", "#808080", "#c0c0c0", "#800000", "#ff0000", "#808000", "#ffff00",
+    "#008000", "#00ff00", "#008080", "#00ffff", "#000080", "#0000ff", "#800080", "#ff00ff",
+]]
+
+
+def convertImage(image, image_format):
+    """Convert image to a document format, snapping colors to its palette"""
+    if image_format == QImage.Format_Mono:
+        return image.convertToFormat(image_format, LINEART_PALETTE, Qt.ThresholdDither)
+    if image_format == QImage.Format_Indexed8:
+        return image.convertToFormat(image_format, INDEXED_PALETTE, Qt.ThresholdDither)
+    return image.convertToFormat(image_format)
+
+
+# Tools that preview a rubber-band shape in the overlay until release
+SHAPE_TOOLS = ["line", "rect", "ellipse"]
+
+
+def strokePath(points):
+    """Return a smoothed path through the stroke's sample points"""
+    path = QPainterPath(QPointF(points[0]))
+    for i in range(1, len(points) - 1):
+        # Quadratic segments through the midpoints round off the mouse polyline
+        mid = (QPointF(points[i]) + QPointF(points[i + 1])) / 2
+        path.quadTo(QPointF(points[i]), mid)
+    path.lineTo(QPointF(points[-1]))
+    return path
+
+
+class PreviewBuffer:
+    """Transparent image covering only the area a stroke preview has reached"""
+
+    # Smallest margin added around the stroke each time the buffer grows
+    GROW_MARGIN = 128
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.rect = QRect()
+        self.image = None
+
+    def reserve(self, rect):
+        """Grow the buffer, keeping its contents, until it covers rect"""
+        rect = rect & self.bounds
+        if rect.isEmpty() or self.rect.contains(rect):
+            return
+        if self.rect.isEmpty():
+            margin = self.GROW_MARGIN
+            grown = rect.adjusted(-margin, -margin, margin, margin) & self.bounds
+        else:
+            # Grow only towards the stroke, by half the current size, so a long
+            # stroke reallocates only a few times
+            mx = max(self.GROW_MARGIN, self.rect.width() // 2)
+            my = max(self.GROW_MARGIN, self.rect.height() // 2)
+            grown = self.rect | rect
+            grown.adjust(-mx if rect.left() < self.rect.left() else 0,
+                         -my if rect.top() < self.rect.top() else 0,
+                         mx if rect.right() > self.rect.right() else 0,
+                         my if rect.bottom() > self.rect.bottom() else 0)
+            grown &= self.bounds
+        image = QImage(grown.size(), QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        if self.image is not None:
+            painter = QPainter(image)
+            painter.drawImage(self.rect.topLeft() - grown.topLeft(), self.image)
+            painter.end()
+        self.image, self.rect = image, grown
+
+    def painter(self):
+        """Return a painter on the buffer that takes canvas coordinates"""
+        painter = QPainter(self.image)
+        painter.translate(-self.rect.topLeft())
+        return painter
+
+    def paint(self, painter, rect):
+        area = rect & self.rect
+        if not area.isEmpty():
+            painter.drawImage(area, self.image, area.translated(-self.rect.topLeft()))
+
+
+class StrokeRenderer:
+    """Render a finished stroke with antialiasing into an image of its bounding box"""
+
+    def __init__(self, points, color, size):
+        self.points = points
+        self.color = QColor(color)
+        self.size = size
+        self.preview = None
+        self.image = None
+        self.offset = QPoint()
+        self.done = False
+
+    def run(self, bounds):
+        path = strokePath(self.points)
+        margin = self.size / 2 + 2
+        rect = path.boundingRect().adjusted(-margin, -margin, margin, margin).toAlignedRect() & bounds
+        if not rect.isEmpty():
+            image = QImage(rect.size(), QImage.Format_ARGB32_Premultiplied)
+            image.fill(Qt.transparent)
+            painter = QPainter(image)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.translate(-rect.topLeft())
+            painter.setPen(QPen(self.color, self.size,
+                                Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+            painter.drawPath(path)
+            painter.end()
+            self.image = image
+            self.offset = rect.topLeft()
+
+    def previewRect(self):
+        """Return the area covered by the aliased preview of the stroke"""
+        margin = self.size // 2 + 2
+        return QPolygon(self.points).boundingRect().adjusted(-margin, -margin, margin, margin)
+
+
+class PendingShape:
+    """A queued shape or lasso edit, drawn over the front buffer until committed"""
+
+    def __init__(self, rect, draw):
+        self.rect = rect
+        self.draw = draw
+        self.done = False
+
+
 class Canvas(QWidget):
-    def __init__(self, parent=None, width=800, height=600):
+    """Drawing surface.
+
+    Every edit of self.image is queued as a command for the render thread,
+    which owns the image. paintEvent only reads self.frontImage and
+    self.frontStrokes, the image and vector strokes published after each
+    command. With threaded=False (headless use) commands run immediately
+    on the calling thread.
+    """
+
+    # Emitted on the GUI thread after a region of frontImage changed
+    regionPublished = pyqtSignal(QRect)
+    # Emitted when a published state has another color mode, e.g. after undo
+    colorModeChanged = pyqtSignal(str)
+    # Emitted with the new width and height when a published state is resized
+    sizeChanged = pyqtSignal(int, int)
+    # Emitted on the GUI thread with the (image, vector strokes) asked for by requestSnapshot
+    snapshotTaken = pyqtSignal(QImage, object)
+
+    def __init__(self, parent=None, width=800, height=600, threaded=True):
         super().__init__(parent)
         # Set fixed dimensions for the canvas
         self.canvas_width = width
@@ -32,40 +190,330 @@ class Canvas(QWidget):
         self.undo_stack = []
         self.redo_stack = []
         self.max_undo_steps = 5
+        # Pencil/eraser stroke in progress, previewed aliased until release
+        self.strokePoints = []
+        self.strokeColor = QColor(Qt.black)
+        self.strokeBuffer = None
+        # Released strokes whose previews stay visible until committed, oldest first
+        self.pendingStrokes = []
+        self.pendingShapes = []
+        # Transient tool feedback painted over the image, never into it
+        self.shapeStart = None
+        self.shapeEnd = None
+        self.cursorPos = None
+        self.overlayRect = QRect()
+        self.setMouseTracking(True)
+        # Optional pencil mode that keeps strokes as curves above the image
+        self.vectorMode = False
+        self.vectorLayer = VectorLayer()
+
+        # Low-resolution copy for the navigator and history thumbnails
+        self.proxy = ImageProxy(self.image)
+        self.proxyRestored = False
+
+        self.front = (QImage(self.image), self.vectorLayer.strokes)
+        self.frontProxy = QImage(self.proxy.image)
+        self.publishedMode = self.colorMode()
+        self.renderThread = None
+        if threaded:
+            self.renderThread = RenderThread(self)
+            self.renderThread.published.connect(self.onPublished)
+            self.renderThread.start()
+
+    def submit(self, command):
+        """Queue a command that edits self.image and returns the rect it changed"""
+        if self.renderThread is None:
+            rect = command() or QRect()
+            self.publishFront(rect)
+            self.onPublished(rect)
+        else:
+            self.renderThread.submit(command)
+
+    def publishFront(self, rect):
+        """Bring the proxy up to date for rect and publish both front buffers"""
+        if self.image.size() != self.proxy.sourceSize:
+            self.proxy.reset(self.image, self.vectorLayer.strokes)
+        elif not self.proxyRestored:
+            self.proxy.update(self.image, rect, self.vectorLayer.strokes)
+        self.proxyRestored = False
+        # Implicitly shared: the next edit detaches self.image, not the front buffer
+        # Swapped as one pair, so the strokes always match the image beneath them
+        self.front = (QImage(self.image), self.vectorLayer.strokes)
+        self.frontProxy = QImage(self.proxy.image)
+
+    @property
+    def frontImage(self):
+        return self.front[0]
+
+    @property
+    def frontStrokes(self):
+        return self.front[1]
+
+    def onPublished(self, rect):
+        """Repaint a region the render thread has finished"""
+        front = self.frontImage
+        if (front.width(), front.height()) != self.getCanvasSize():
+            self.canvas_width = front.width()
+            self.canvas_height = front.height()
+            self.setFixedSize(self.canvas_width, self.canvas_height)
+            rect = self.rect()
+            self.sizeChanged.emit(self.canvas_width, self.canvas_height)
+        mode = self.colorMode()
+        if mode != self.publishedMode:
+            self.publishedMode = mode
+            self.colorModeChanged.emit(mode)
+        while self.pendingStrokes and self.pendingStrokes[0].done:
+            self.pendingStrokes.pop(0)
+        while self.pendingShapes and self.pendingShapes[0].done:
+            self.pendingShapes.pop(0)
+        if not rect.isEmpty():
+            self.update(rect)
+            self.regionPublished.emit(rect)
+
+    def requestSnapshot(self):
+        """Capture the document once every queued command has been applied.
+
+        Unlike waitForRender this returns at once; the snapshot arrives
+        through snapshotTaken.
+        """
+        def command():
+            self.snapshotTaken.emit(QImage(self.image), self.vectorLayer.strokes)
+
+        self.submit(command)
+
+    def waitForRender(self):
+        """Block until every queued command has been applied"""
+        if self.renderThread is not None:
+            self.renderThread.commands.join()
+
+    def stopRendering(self):
+        """Apply the queued commands and stop the render thread"""
+        if self.renderThread is not None:
+            self.renderThread.stop()
+            self.renderThread = None
 
     def saveState(self):
         """Save current state to undo stack"""
+        self.submit(self.pushUndoState)
+
+    def colorMode(self):
+        """Return the document color mode, derived from the image format"""
+        for mode, image_format in COLOR_MODES.items():
+            if self.frontImage.format() == image_format:
+                return mode
+        return "rgb"
+
+    def setColorMode(self, mode):
+        """Convert the document to another color mode as one history step"""
+        def command():
+            if self.image.format() == COLOR_MODES[mode]:
+                return None
+            self.pushUndoState()
+            self.image = convertImage(self.image.convertToFormat(QImage.Format_RGB32), COLOR_MODES[mode])
+            return self.image.rect()
+
+        self.submit(command)
+
+    def documentSwatch(self, color):
+        """Return a 1×1 image holding color as stored in the current color mode"""
+        pixel = QImage(1, 1, QImage.Format_RGB32)
+        pixel.fill(color)
+        return convertImage(pixel, self.image.format())
+
+    def documentColor(self, color):
+        """Return color snapped to the current color mode"""
+        return self.documentSwatch(color).pixelColor(0, 0)
+
+    def editRegion(self, rect, draw):
+        """Call draw(painter) to paint within rect of the image in any color mode.
+
+        Mono and indexed images can't be painted on, so only the affected
+        region is expanded to RGB32, drawn on and converted back.
+        """
+        if self.image.format() in (QImage.Format_RGB32, QImage.Format_Grayscale8):
+            painter = QPainter(self.image)
+            draw(painter)
+            painter.end()
+            return
+
+        rect = rect & self.image.rect()
+        if rect.isEmpty():
+            return
+        if self.image.format() == QImage.Format_Mono:
+            # Whole bytes only, so rows can be copied back without bit shifting
+            left = rect.left() // 8 * 8
+            right = min(self.image.width(), (rect.right() // 8 + 1) * 8)
+            rect = QRect(left, rect.top(), right - left, rect.height())
+
+        region = self.image.copy(rect).convertToFormat(QImage.Format_RGB32)
+        painter = QPainter(region)
+        painter.translate(-rect.topLeft())
+        draw(painter)
+        painter.end()
+        self.pasteRegion(convertImage(region, self.image.format()), rect.topLeft())
+
+    def pasteRegion(self, region, point):
+        """Copy the rows of a same-format 1- or 8-bit region into the image"""
+        if self.image.format() == QImage.Format_Mono:
+            offset, length = point.x() // 8, (region.width() + 7) // 8
+        else:
+            offset, length = point.x(), region.width()
+
+        bits = self.image.bits()
+        bits.setsize(self.image.sizeInBytes())
+        bytes_per_line = self.image.bytesPerLine()
+        for y in range(region.height()):
+            start = (point.y() + y) * bytes_per_line + offset
+            bits[start:start + length] = region.constScanLine(y).asstring(length)
+
+    def pushUndoState(self):
+        """Push the current state; runs as, or inside, a render command"""
         if len(self.undo_stack) >= self.max_undo_steps:
             self.undo_stack.pop(0)
-        self.undo_stack.append(self.image.copy())
+        self.undo_stack.append(self.historyState())
         self.redo_stack.clear()
 
+    def historyState(self):
+        """Return an (image, vector strokes, proxy) history entry.
+
+        QImage copies are implicitly shared and only detach when painted on,
+        so an entry for a vector-only edit costs no pixel memory. The proxy
+        doubles as the entry's history thumbnail.
+        """
+        return (QImage(self.image), self.vectorLayer.strokes, QImage(self.proxy.image))
+
+    def restoreState(self, state):
+        image, strokes, proxy = state
+        self.image = image
+        self.vectorLayer.setStrokes(strokes)
+        if proxy.size() == self.proxy.image.size():
+            # The stored proxy already matches, so skip downscaling the whole image
+            self.proxy.image = QImage(proxy)
+            self.proxyRestored = True
+        return image.rect()
+
     def undo(self):
         """Undo last action"""
-        if self.undo_stack:
+        def command():
+            if not self.undo_stack:
+                return None
             if len(self.redo_stack) >= self.max_undo_steps:
                 self.redo_stack.pop(0)
-            self.redo_stack.append(self.image.copy())
-            self.image = self.undo_stack.pop().copy()
-            self.update()
+            self.redo_stack.append(self.historyState())
+            return self.restoreState(self.undo_stack.pop())
+
+        self.submit(command)
 
     def redo(self):
         """Redo last undone action"""
-        if self.redo_stack:
+        def command():
+            if not self.redo_stack:
+                return None
             if len(self.undo_stack) >= self.max_undo_steps:
                 self.undo_stack.pop(0)
-            self.undo_stack.append(self.image.copy())
-            self.image = self.redo_stack.pop().copy()
-            self.update()
+            self.undo_stack.append(self.historyState())
+            return self.restoreState(self.redo_stack.pop())
+
+        self.submit(command)
 
     def paintEvent(self, event):
         painter = QPainter(self)
-        painter.drawImage(self.rect(), self.image, self.image.rect())
+        rect = event.rect()
+        front, strokes = self.front
+        if front.format() == QImage.Format_RGB32:
+            painter.drawImage(rect, front, rect)
+        else:
+            # Expand only the dirty region of a compact document for display
+            painter.drawImage(rect.topLeft(), front.copy(rect).convertToFormat(QImage.Format_RGB32))
+        self.vectorLayer.paint(painter, rect, strokes)
+
+        for job in self.pendingStrokes:
+            job.preview.paint(painter, rect)
+        for shape in self.pendingShapes:
+            if shape.rect.intersects(rect):
+                painter.save()
+                shape.draw(painter)
+                painter.restore()
+        if self.strokeBuffer is not None:
+            self.strokeBuffer.paint(painter, rect)
 
+        self.paintOverlay(painter)
+
+    def paintOverlay(self, painter):
+        """Paint the lasso path, shape preview and brush outline"""
         if self.isLassoActive and len(self.lassoPoints) > 1:
             painter.setPen(QPen(Qt.blue, 1, Qt.DashLine))
             painter.drawPolygon(QPolygon(self.lassoPoints))
 
+        if self.shapeStart is not None and self.shapeEnd is not None:
+            # Snapped like the committed shape, so it keeps its color on release
+            self.drawShape(painter, self.currentTool, self.shapeStart, self.shapeEnd,
+                           self.documentColor(self.brushColor), self.brushSize)
+
+        if self.cursorPos is not None and self.currentTool in ["pencil", "eraser"]:
+            radius = self.brushSize / 2
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            painter.setPen(QPen(Qt.gray, 1))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawEllipse(QPointF(self.cursorPos), radius, radius)
+
+    def overlayBounds(self):
+        """Return the widget area covered by the current overlay"""
+        bounds = QRect()
+        margin = self.brushSize // 2 + 2
+        if self.isLassoActive and len(self.lassoPoints) > 1:
+            bounds |= QPolygon(self.lassoPoints).boundingRect().adjusted(-2, -2, 2, 2)
+        if self.shapeStart is not None and self.shapeEnd is not None:
+            bounds |= QRect(self.shapeStart, self.shapeEnd).normalized().adjusted(
+                -margin, -margin, margin, margin)
+        if self.cursorPos is not None and self.currentTool in ["pencil", "eraser"]:
+            bounds |= QRect(self.cursorPos, self.cursorPos).adjusted(-margin, -margin, margin, margin)
+        return bounds
+
+    def updateOverlay(self):
+        """Repaint only the previous and the new overlay areas"""
+        bounds = self.overlayBounds()
+        if not self.overlayRect.isEmpty():
+            self.update(self.overlayRect)
+        if not bounds.isEmpty():
+            self.update(bounds)
+        self.overlayRect = bounds
+
+    def drawShape(self, painter, tool, start, end, color, size):
+        """Draw a line, rectangle or ellipse outline with the given brush"""
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(color, size,
+                            Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+        painter.setBrush(Qt.NoBrush)
+        if tool == "line":
+            painter.drawLine(start, end)
+        elif tool == "rect":
+            painter.drawRect(QRect(start, end).normalized())
+        elif tool == "ellipse":
+            painter.drawEllipse(QRect(start, end).normalized())
+
+    def commitShape(self, start, end):
+        """Draw the finished shape onto the image"""
+        tool, color, size = self.currentTool, self.documentColor(self.brushColor), self.brushSize
+        margin = size // 2 + 2
+        rect = QRect(start, end).normalized().adjusted(-margin, -margin, margin, margin)
+        shape = PendingShape(rect, lambda painter: self.drawShape(painter, tool, start, end, color, size))
+        self.pendingShapes.append(shape)
+
+        def command():
+            try:
+                flattened = self.flattenStrokes()
+                self.editRegion(rect, shape.draw)
+                return rect | flattened
+            finally:
+                shape.done = True
+
+        self.submit(command)
+
+    def leaveEvent(self, event):
+        self.cursorPos = None
+        self.updateOverlay()
+
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
             self.drawing = True
@@ -78,26 +526,25 @@ class Canvas(QWidget):
             elif self.currentTool == "lasso":
                 self.lassoPoints = [event.pos()]
                 self.isLassoActive = True
+            elif self.currentTool in ["pencil", "eraser"]:
+                color = self.brushColor if self.currentTool == "pencil" else QColor(Qt.white)
+                self.beginStroke(event.pos(), color)
+            elif self.currentTool in SHAPE_TOOLS:
+                self.shapeStart = event.pos()
+                self.shapeEnd = event.pos()
 
     def mouseMoveEvent(self, event):
+        self.cursorPos = event.pos()
         if (event.buttons() & Qt.LeftButton) and self.drawing:
-            if self.currentTool == "pencil":
-                painter = QPainter(self.image)
-                painter.setPen(QPen(self.brushColor, self.brushSize,
-                                    Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
-                painter.drawLine(self.lastPoint, event.pos())
-                self.lastPoint = event.pos()
-                self.update()
-            elif self.currentTool == "eraser":
-                painter = QPainter(self.image)
-                painter.setPen(QPen(Qt.white, self.brushSize,
-                                    Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
-                painter.drawLine(self.lastPoint, event.pos())
+            if self.currentTool in ["pencil", "eraser"]:
+                self.strokePoints.append(event.pos())
+                self.drawSegment(self.lastPoint, event.pos(), self.strokeColor)
                 self.lastPoint = event.pos()
-                self.update()
             elif self.currentTool == "lasso":
                 self.lassoPoints.append(event.pos())
-                self.update()
+            elif self.currentTool in SHAPE_TOOLS:
+                self.shapeEnd = event.pos()
+        self.updateOverlay()
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton and self.drawing:
@@ -106,19 +553,114 @@ class Canvas(QWidget):
                 self.saveState()
                 self.processLassoSelection()
             elif self.currentTool in ["pencil", "eraser"]:
+                self.endStroke()
+            elif self.currentTool in SHAPE_TOOLS and self.shapeStart != self.shapeEnd:
                 self.saveState()
+                self.commitShape(self.shapeStart, self.shapeEnd)
             self.lassoPoints = []
             self.isLassoActive = False
-            self.update()
+            self.shapeStart = None
+            self.shapeEnd = None
+            self.updateOverlay()
+
+    def beginStroke(self, point, color):
+        """Start a pencil/eraser stroke with an empty preview buffer"""
+        self.strokePoints = [point]
+        self.strokeColor = self.documentColor(color)
+        self.strokeBuffer = PreviewBuffer(self.frontImage.rect())
+
+    def drawSegment(self, start, end, color):
+        """Draw a fast aliased preview segment into the stroke buffer"""
+        margin = self.brushSize // 2 + 2
+        rect = QRect(start, end).normalized().adjusted(-margin, -margin, margin, margin)
+        self.strokeBuffer.reserve(rect)
+        if self.strokeBuffer.image is None:
+            # The whole segment lies outside the canvas
+            return
+        painter = self.strokeBuffer.painter()
+        painter.setPen(QPen(color, self.brushSize,
+                            Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+        painter.drawLine(start, end)
+        painter.end()
+        self.update(rect)
+
+    def endStroke(self):
+        """Queue the antialiased, smoothed re-render of the stroke just drawn"""
+        points, self.strokePoints = self.strokePoints, []
+        preview, self.strokeBuffer = self.strokeBuffer, None
+        if len(points) < 2:
+            return
+
+        job = StrokeRenderer(points, self.strokeColor, self.brushSize)
+        job.preview = preview
+        self.pendingStrokes.append(job)
+        # Pencil strokes become curves in vector mode; the eraser still works on pixels
+        as_vector = self.vectorMode and self.currentTool == "pencil"
+
+        def command():
+            # The preview is dropped even if rendering fails, or it would stay forever
+            try:
+                self.pushUndoState()
+                if as_vector:
+                    rect = self.vectorLayer.addStroke(job.points, job.color, job.size)
+                else:
+                    rect = self.flattenStrokes()
+                    job.run(self.image.rect())
+                    if job.image is not None:
+                        self.compositeStroke(job)
+                        rect |= QRect(job.offset, job.image.size())
+                return rect | job.previewRect()
+            finally:
+                job.done = True
+
+        self.submit(command)
+
+    def compositeStroke(self, job):
+        rect = QRect(job.offset, job.image.size())
+        self.editRegion(rect, lambda painter: painter.drawImage(job.offset, job.image))
+
+    def drawStroke(self, points, color):
+        """Render a complete stroke with antialiasing straight onto the image"""
+        if len(points) < 2:
+            return
+        job = StrokeRenderer(points, color, self.brushSize)
+
+        def command():
+            rect = self.flattenStrokes()
+            job.run(self.image.rect())
+            if job.image is not None:
+                self.compositeStroke(job)
+                rect |= QRect(job.offset, job.image.size())
+            return rect
+
+        self.submit(command)
 
     def fill(self, point):
+        """Flood fill from point with the brush color"""
+        color = QColor(self.brushColor)
+
+        def command():
+            # Fill against what is on screen, vector outlines included
+            rect = self.flattenStrokes()
+            return (self.floodFill(point, color) or QRect()) | rect
+
+        self.submit(command)
+
+    def floodFill(self, point, color):
         """Flood fill implementation"""
         image = self.image
-        target_color = image.pixelColor(point)
-        fill_color = self.brushColor
+        # Compare and write raw pixel values so compact modes are filled in place
+        swatch = self.documentSwatch(color)
+        if image.format() in (QImage.Format_Mono, QImage.Format_Indexed8):
+            read_pixel = image.pixelIndex
+            fill_color = swatch.pixelIndex(0, 0)
+        else:
+            read_pixel = image.pixel
+            fill_color = swatch.pixel(0, 0)
+        target_color = read_pixel(point)
 
         if target_color == fill_color:
-            return
+            return None
 
         stack = [point]
         width, height = image.width(), image.height()
@@ -132,10 +674,10 @@ class Canvas(QWidget):
             if (n.x(), n.y()) in visited:
                 continue
 
-            if image.pixelColor(n) != target_color:
+            if read_pixel(n) != target_color:
                 continue
 
-            image.setPixelColor(n, fill_color)
+            image.setPixel(n, fill_color)
             visited.add((n.x(), n.y()))
 
             stack.append(QPoint(n.x() + 1, n.y()))
@@ -143,55 +685,162 @@ class Canvas(QWidget):
             stack.append(QPoint(n.x(), n.y() + 1))
             stack.append(QPoint(n.x(), n.y() - 1))
 
-        self.update()
+        return image.rect()
 
     def processLassoSelection(self):
         """Process the selected area with lasso tool"""
         if len(self.lassoPoints) > 2:
-            painter = QPainter(self.image)
-            painter.setPen(QPen(self.brushColor, self.brushSize,
-                                Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
-            painter.drawPolygon(QPolygon(self.lassoPoints))
-            self.update()
+            polygon = QPolygon(self.lassoPoints)
+            color, size = self.documentColor(self.brushColor), self.brushSize
+            margin = size // 2 + 2
+            rect = polygon.boundingRect().adjusted(-margin, -margin, margin, margin)
+
+            def draw(painter):
+                painter.setPen(QPen(color, size,
+                                    Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+                painter.drawPolygon(polygon)
+
+            # Stays visible in place of the lasso until the render thread commits it
+            shape = PendingShape(rect, draw)
+            self.pendingShapes.append(shape)
+
+            def command():
+                try:
+                    flattened = self.flattenStrokes()
+                    self.editRegion(rect, draw)
+                    return rect | flattened
+                finally:
+                    shape.done = True
+
+            self.submit(command)
             
     def setCanvasSize(self, width, height):
         """Set a new canvas size while preserving content"""
         self.saveState()  # Save current state for undo
+
+        def command():
+            # Create new image with the new dimensions
+            new_image = QImage(QSize(width, height), QImage.Format_RGB32)
+            new_image.fill(Qt.white)
+
+            # Draw the old image onto the new one (centered if larger, cropped if smaller)
+            painter = QPainter(new_image)
+
+            # Calculate position to center the old image on the new canvas
+            x_offset = max(0, (width - self.image.width()) // 2)
+            y_offset = max(0, (height - self.image.height()) // 2)
+
+            painter.drawImage(QPoint(x_offset, y_offset), self.image)
+            painter.end()
+            self.vectorLayer.setStrokes([stroke.translated(x_offset, y_offset)
+                                         for stroke in self.vectorLayer.strokes])
+
+            # The widget is resized on the GUI thread once this is published
+            self.image = convertImage(new_image, self.image.format())
+            return self.image.rect()
+
+        self.submit(command)
         
-        # Create new image with the new dimensions
-        new_image = QImage(QSize(width, height), QImage.Format_RGB32)
-        new_image.fill(Qt.white)
-        
-        # Draw the old image onto the new one (centered if larger, cropped if smaller)
-        painter = QPainter(new_image)
-        
-        # Calculate position to center the old image on the new canvas
-        x_offset = max(0, (width - self.canvas_width) // 2)
-        y_offset = max(0, (height - self.canvas_height) // 2)
-        
-        painter.drawImage(QPoint(x_offset, y_offset), self.image)
-        painter.end()
-        
-        # Update canvas properties
-        self.canvas_width = width
-        self.canvas_height = height
-        self.setFixedSize(width, height)
-        self.image = new_image
-        self.update()
-        
+    def scaleImage(self, width, height, resample_filter="lanczos"):
+        """Resample the content to a new size as one history step.
+
+        A nearest-neighbour preview is published at once. With another
+        filter, the filtered result is computed in background tiles and
+        each tile replaces its part of the preview when it is ready.
+        """
+        if (width, height) == self.getCanvasSize():
+            return
+        self.saveState()
+        resample = None if resample_filter == "nearest" else Resample(width, height, resample_filter)
+
+        def preview():
+            sx, sy = width / self.image.width(), height / self.image.height()
+            if resample is not None:
+                resample.start(self.image)
+            self.image = self.image.scaled(width, height, Qt.IgnoreAspectRatio, Qt.FastTransformation)
+            self.vectorLayer.setStrokes([stroke.scaled(sx, sy) for stroke in self.vectorLayer.strokes])
+            return self.image.rect()
+
+        self.submit(preview)
+        if resample is None:
+            return
+
+        def refine(index, rect):
+            def command():
+                tile = resample.tile(index)
+                self.editRegion(rect, lambda painter: painter.drawImage(rect.topLeft(), tile))
+                return rect
+            return command
+
+        # Edits made meanwhile queue behind the tiles and land on the final result
+        for index, rect in enumerate(resample.rects):
+            self.submit(refine(index, rect))
+
     def getCanvasSize(self):
         """Return the current canvas dimensions"""
         return (self.canvas_width, self.canvas_height)
 
     def clear(self):
         self.saveState()
-        self.image.fill(Qt.white)
-        self.update()
+
+        def command():
+            self.image.fill(Qt.white)
+            self.vectorLayer.setStrokes(())
+            return self.image.rect()
+
+        self.submit(command)
+
+    def flattenStrokes(self):
+        """Rasterize the vector strokes into the image; return the rect they covered.
+
+        Raster tools call this first, so the eraser, fill, lasso, shapes and
+        imports see and change the strokes instead of landing under them.
+        """
+        strokes = self.vectorLayer.strokes
+        if not strokes:
+            return QRect()
+        bounds = QRectF()
+        for stroke in strokes:
+            bounds |= stroke.bounds
+        rect = bounds.toAlignedRect() & self.image.rect()
+        self.editRegion(rect, lambda painter: paintStrokes(painter, strokes))
+        self.vectorLayer.setStrokes(())
+        return rect
+
+    def flattenedImage(self):
+        """Return the image with the vector strokes rasterized onto it"""
+        self.waitForRender()
+        if not self.vectorLayer.strokes:
+            return self.image
+        image = self.image.convertToFormat(QImage.Format_RGB32)
+        painter = QPainter(image)
+        paintStrokes(painter, self.vectorLayer.strokes)
+        painter.end()
+        return convertImage(image, self.image.format())
         
+    def addImageFile(self, file_path, x, y, width, height, maintain_aspect=True):
+        """Decode, scale and add an image file at (x, y) on the render thread"""
+        def command():
+            image = ImageHandler.load_image(file_path)
+            if image is None:
+                raise IOError(f"Failed to load {file_path}")
+            image = ImageHandler.scale_image(image, width, height, maintain_aspect)
+            self.pushUndoState()
+            rect = QRect(QPoint(x, y), image.size())
+            flattened = self.flattenStrokes()
+            self.editRegion(rect, lambda painter: painter.drawImage(QPoint(x, y), image))
+            return rect | flattened
+
+        self.submit(command)
+
     def addImage(self, imported_image, x=0, y=0):
         """Add an imported QImage to the canvas at position (x,y)"""
         self.saveState()
-        painter = QPainter(self.image)
-        painter.drawImage(QPoint(x, y), imported_image)
-        painter.end()
-        self.update()
+        rect = QRect(QPoint(x, y), imported_image.size())
+
+        def command():
+            flattened = self.flattenStrokes()
+            self.editRegion(rect, lambda painter: painter.drawImage(QPoint(x, y), imported_image))
+            return rect | flattened
+
+        self.submit(command)
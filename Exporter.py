@@ -0,0 +1,308 @@
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
+                           QLineEdit, QPushButton, QCheckBox, QFileDialog,
+                           QDialogButtonBox, QGroupBox)
+from PyQt5 import sip
+from concurrent.futures import ProcessPoolExecutor
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+from VectorLayer import VectorStroke, paintStrokes
+
+# Each preset is one output of a multi-target export. The canvas is multiplied
+# by scale and then, if a width/height box is given, shrunk to fit inside it.
+EXPORT_PRESETS = [
+    {'name': 'full', 'format': 'png', 'scale': 1, 'width': None, 'height': None, 'quality': -1},
+    {'name': 'print-4x', 'format': 'png', 'scale': 4, 'width': None, 'height': None, 'quality': -1},
+    {'name': 'web-large', 'format': 'jpg', 'scale': 1, 'width': 2048, 'height': 2048, 'quality': 90},
+    {'name': 'web-medium', 'format': 'jpg', 'scale': 1, 'width': 1280, 'height': 1280, 'quality': 85},
+    {'name': 'web-small', 'format': 'jpg', 'scale': 1, 'width': 640, 'height': 640, 'quality': 75},
+    {'name': 'thumb', 'format': 'png', 'scale': 1, 'width': 256, 'height': 256, 'quality': -1},
+    {'name': 'thumb-small', 'format': 'png', 'scale': 1, 'width': 128, 'height': 128, 'quality': -1},
+]
+
+PNG_CHUNK_SIZE = 64 * 1024
+
+# Formats written to PNG as-is: (color type, bit depth, bits per pixel)
+NATIVE_PNG_FORMATS = {
+    QImage.Format_Grayscale8: (0, 8, 8),
+    QImage.Format_Indexed8: (3, 8, 8),
+    QImage.Format_Mono: (3, 1, 1),
+}
+
+# Worker processes kept alive between exports, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _png_chunk(fh, tag, data):
+    fh.write(struct.pack(">I", len(data)))
+    fh.write(tag)
+    fh.write(data)
+    fh.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+
+
+def write_png_streamed(image, file_path, compress_level=6):
+    """Write a QImage as a PNG one scanline at a time.
+
+    Rows are deflated incrementally and flushed as IDAT chunks, so the encoded
+    file is never held in memory as a whole. Grayscale, 1-bit and indexed
+    images keep their compact layout; everything else is written as RGB.
+    """
+    if image.format() in NATIVE_PNG_FORMATS:
+        color_type, bit_depth, bits_per_pixel = NATIVE_PNG_FORMATS[image.format()]
+    else:
+        image = image.convertToFormat(QImage.Format_RGB888)
+        color_type, bit_depth, bits_per_pixel = 2, 8, 24
+    width, height = image.width(), image.height()
+    row_bytes = (width * bits_per_pixel + 7) // 8
+    compressor = zlib.compressobj(compress_level)
+
+    with open(file_path, 'wb') as fh:
+        fh.write(b'\x89PNG\r\n\x1a\n')
+        _png_chunk(fh, b'IHDR', struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0))
+        if color_type == 3:
+            palette = b''.join(struct.pack("BBB", qRed(c), qGreen(c), qBlue(c))
+                               for c in image.colorTable())
+            _png_chunk(fh, b'PLTE', palette)
+
+        pending = b''
+        for y in range(height):
+            # Filter type 0 (None) followed by the raw row
+            row = image.constScanLine(y).asstring(row_bytes)
+            pending += compressor.compress(b'\x00' + row)
+            if len(pending) >= PNG_CHUNK_SIZE:
+                _png_chunk(fh, b'IDAT', pending)
+                pending = b''
+
+        pending += compressor.flush()
+        if pending:
+            _png_chunk(fh, b'IDAT', pending)
+        _png_chunk(fh, b'IEND', b'')
+
+    return True
+
+
+def _export_pool():
+    """Return the warm export pool, starting it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawn rather than fork: forking a process running a Qt event loop is unsafe
+            context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=context)
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the export worker processes, e.g. when the application quits"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def _export_worker(snapshot_path, width, height, bytes_per_line, image_format, color_table,
+                   strokes, preset, file_path):
+    """Encode one preset from the shared raw snapshot.
+
+    The snapshot is memory-mapped read-only, so every worker reads the same
+    page cache instead of holding a private copy of the canvas.
+    """
+    with open(snapshot_path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        image = QImage(sip.voidptr(data), width, height, bytes_per_line, QImage.Format(image_format))
+        if color_table:
+            image.setColorTable(color_table)
+        return _export_image(image, width, height, strokes, preset, file_path)
+
+
+def _export_image(image, width, height, strokes, preset, file_path):
+    """Scale, draw the strokes onto and encode one preset"""
+    scale = preset['scale']
+    if preset['width'] is not None and preset['height'] is not None:
+        scale = min(scale, preset['width'] / width, preset['height'] / height)
+    if scale != 1:
+        image = image.scaled(max(1, round(width * scale)), max(1, round(height * scale)),
+                             Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    if strokes:
+        # Vector strokes are rendered at the output size, not resampled
+        image = image.convertToFormat(QImage.Format_RGB32)
+        painter = QPainter(image)
+        paintStrokes(painter, [VectorStroke.fromDict(data) for data in strokes], scale)
+        painter.end()
+
+    if preset['format'] == 'png':
+        ok = write_png_streamed(image, file_path)
+    else:
+        ok = image.save(file_path, preset['format'].upper(), preset['quality'])
+    return file_path if ok else None
+
+
+class Exporter:
+    """Class to export the canvas to several files in one pass"""
+
+    @staticmethod
+    def export_variants(image, directory, base_name, presets=None, max_workers=None, strokes=None):
+        """Export image once per preset, in parallel; return the written paths.
+
+        Presets that fail to export are left out of the returned paths.
+
+        With several CPUs, the canvas is snapshotted once to a raw temporary
+        file that the warm worker processes map, so the GUI's image is not
+        pickled per preset. With one CPU, or max_workers=1, the presets are
+        encoded in this process, since a pool only adds overhead there.
+        strokes is an optional VectorLayer.toList() drawn over the image.
+        """
+        if presets is None:
+            presets = EXPORT_PRESETS
+        if not presets:
+            return []
+        if max_workers is None:
+            max_workers = min(len(presets), os.cpu_count() or 1)
+        if max_workers <= 1:
+            return Exporter.export_sequential(image, directory, base_name, presets, strokes)
+
+        # Compact documents are shipped to the workers in their own format
+        if image.format() in NATIVE_PNG_FORMATS:
+            snapshot = image
+        else:
+            snapshot = image.convertToFormat(QImage.Format_RGB32)
+        width, height = snapshot.width(), snapshot.height()
+        bytes_per_line = snapshot.bytesPerLine()
+        image_format = int(snapshot.format())
+        color_table = list(snapshot.colorTable())
+
+        fd, snapshot_path = tempfile.mkstemp(suffix='.raw', prefix='artbook-')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(snapshot.constBits().asstring(snapshot.sizeInBytes()))
+
+            pool = _export_pool()
+            futures = [
+                pool.submit(_export_worker, snapshot_path, width, height, bytes_per_line,
+                            image_format, color_table, strokes, preset,
+                            Exporter.variant_path(directory, base_name, preset))
+                for preset in presets
+            ]
+            results = []
+            for future in futures:
+                # One failed output (read-only folder, full disk) must not lose the others
+                try:
+                    results.append(future.result())
+                except Exception:
+                    results.append(None)
+        finally:
+            os.remove(snapshot_path)
+
+        return [path for path in results if path]
+
+    @staticmethod
+    def export_sequential(image, directory, base_name, presets, strokes=None):
+        """Export each preset in turn in this process; return the written paths"""
+        paths = []
+        for preset in presets:
+            file_path = Exporter.variant_path(directory, base_name, preset)
+            try:
+                paths.append(_export_image(image, image.width(), image.height(),
+                                           strokes, preset, file_path))
+            except Exception:
+                pass
+        return [path for path in paths if path]
+
+    @staticmethod
+    def variant_path(directory, base_name, preset):
+        """Return the output path for one preset"""
+        return os.path.join(directory, f"{base_name}-{preset['name']}.{preset['format']}")
+
+
+class ExportThread(QThread):
+    """Run Exporter.export_variants off the GUI thread"""
+
+    def __init__(self, image, config, strokes=None, parent=None):
+        super().__init__(parent)
+        self.image = image
+        self.config = config
+        self.strokes = strokes
+        self.paths = []
+        self.error = None
+
+    def run(self):
+        try:
+            self.paths = Exporter.export_variants(self.image, self.config['directory'],
+                                                  self.config['base_name'], self.config['presets'],
+                                                  strokes=self.strokes)
+        except Exception as e:
+            self.error = e
+
+
+class ExportDialog(QDialog):
+    """Dialog to choose the export destination and presets"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Export")
+        self.setMinimumWidth(400)
+
+        layout = QVBoxLayout(self)
+
+        # Destination directory
+        dir_layout = QHBoxLayout()
+        dir_layout.addWidget(QLabel("Folder:"))
+        self.dir_edit = QLineEdit(os.path.expanduser("~"))
+        dir_layout.addWidget(self.dir_edit)
+        browse_btn = QPushButton("Browse")
+        browse_btn.clicked.connect(self.browse)
+        dir_layout.addWidget(browse_btn)
+        layout.addLayout(dir_layout)
+
+        # Base file name
+        name_layout = QHBoxLayout()
+        name_layout.addWidget(QLabel("Name:"))
+        self.name_edit = QLineEdit("artwork")
+        name_layout.addWidget(self.name_edit)
+        layout.addLayout(name_layout)
+
+        # Presets
+        presets_group = QGroupBox("Outputs")
+        presets_layout = QVBoxLayout(presets_group)
+        self.preset_checks = []
+        for preset in EXPORT_PRESETS:
+            if preset['width'] is None and preset['scale'] != 1:
+                label = f"{preset['name']} ({preset['format'].upper()}, {preset['scale']}× size)"
+            elif preset['width'] is None:
+                label = f"{preset['name']} ({preset['format'].upper()}, full size)"
+            else:
+                label = f"{preset['name']} ({preset['format'].upper()}, {preset['width']}×{preset['height']})"
+            check = QCheckBox(label)
+            # Upscaled outputs are large, so they are opt-in
+            check.setChecked(preset['scale'] <= 1)
+            presets_layout.addWidget(check)
+            self.preset_checks.append((check, preset))
+        layout.addWidget(presets_group)
+
+        # Dialog buttons
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def browse(self):
+        directory = QFileDialog.getExistingDirectory(self, "Export Folder", self.dir_edit.text())
+        if directory:
+            self.dir_edit.setText(directory)
+
+    def get_export_config(self):
+        """Return the configuration for the export"""
+        return {
+            'directory': self.dir_edit.text(),
+            'base_name': self.name_edit.text() or "artwork",
+            'presets': [preset for check, preset in self.preset_checks if check.isChecked()]
+        }
@@ -32,6 +32,25 @@ class ImageHandler:
             return None
             
         return image
+
+    @staticmethod
+    def image_size(file_path):
+        """Return the size of an image file from its header, or None if it can't be read"""
+        reader = QImageReader(file_path)
+        size = reader.size()
+        if not reader.canRead() or not size.isValid():
+            return None
+        return size
+
+    @staticmethod
+    def load_preview(file_path, max_width, max_height):
+        """Decode an image file straight to a size that fits max_width×max_height"""
+        reader = QImageReader(file_path)
+        size = reader.size()
+        if size.isValid():
+            reader.setScaledSize(size.scaled(min(max_width, size.width()),
+                                              min(max_height, size.height()), Qt.KeepAspectRatio))
+        return reader.read()
         
     @staticmethod
     def scale_image(image, width, height, maintain_aspect=True):
@@ -61,12 +80,15 @@ class ImageImportDialog(QDialog):
         self.canvas_width = canvas_width
         self.canvas_height = canvas_height
         self.image_path = image_path
-        self.original_image = QImage(image_path)
+        # Only the header and a preview-sized decode; the full image is
+        # decoded and scaled later, on the canvas's render thread
+        self.original_size = ImageHandler.image_size(image_path)
+        self.preview_source = ImageHandler.load_preview(image_path, 380, 180)
         
         # Default values
         self.maintain_aspect = True
-        self.image_width = min(self.original_image.width(), canvas_width)
-        self.image_height = min(self.original_image.height(), canvas_height)
+        self.image_width = min(self.original_size.width(), canvas_width)
+        self.image_height = min(self.original_size.height(), canvas_height)
         self.x_position = 0
         self.y_position = 0
         
@@ -77,7 +99,7 @@ class ImageImportDialog(QDialog):
         layout = QVBoxLayout(self)
         
         # Image information
-        info_label = QLabel(f"Original size: {self.original_image.width()}×{self.original_image.height()} px")
+        info_label = QLabel(f"Original size: {self.original_size.width()}×{self.original_size.height()} px")
         layout.addWidget(info_label)
         
         # Preview (could be implemented with label and pixmap)
@@ -149,7 +171,7 @@ class ImageImportDialog(QDialog):
         self.image_width = value
         if self.maintain_aspect and not self.width_spin.isSliderDown():
             # Calculate new height maintaining aspect ratio
-            aspect = self.original_image.width() / self.original_image.height()
+            aspect = self.original_size.width() / self.original_size.height()
             self.image_height = int(value / aspect)
             self.height_spin.blockSignals(True)
             self.height_spin.setValue(self.image_height)
@@ -163,7 +185,7 @@ class ImageImportDialog(QDialog):
         self.image_height = value
         if self.maintain_aspect and not self.height_spin.isSliderDown():
             # Calculate new width maintaining aspect ratio
-            aspect = self.original_image.width() / self.original_image.height()
+            aspect = self.original_size.width() / self.original_size.height()
             self.image_width = int(value * aspect)
             self.width_spin.blockSignals(True)
             self.width_spin.setValue(self.image_width)
@@ -177,7 +199,7 @@ class ImageImportDialog(QDialog):
         self.maintain_aspect = state == Qt.Checked
         if self.maintain_aspect:
             # Adjust height to match width with aspect ratio
-            aspect = self.original_image.width() / self.original_image.height()
+            aspect = self.original_size.width() / self.original_size.height()
             self.image_height = int(self.image_width / aspect)
             self.height_spin.blockSignals(True)
             self.height_spin.setValue(self.image_height)
@@ -208,13 +230,6 @@ class ImageImportDialog(QDialog):
         scale_factor = min(canvas_pixmap.width() / self.canvas_width, 
                            canvas_pixmap.height() / self.canvas_height)
         
-        # Draw the imported image on the preview
-        scaled_image = self.original_image.scaled(
-            self.image_width, self.image_height, 
-            Qt.KeepAspectRatio if self.maintain_aspect else Qt.IgnoreAspectRatio, 
-            Qt.SmoothTransformation
-        )
-        
         # Draw on the preview canvas
         preview_x = int(self.x_position * scale_factor)
         preview_y = int(self.y_position * scale_factor)
@@ -222,9 +237,10 @@ class ImageImportDialog(QDialog):
         preview_height = int(self.image_height * scale_factor)
         
         painter = QPainter(canvas_pixmap)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
         painter.drawImage(
             QRect(preview_x, preview_y, preview_width, preview_height),
-            scaled_image
+            self.preview_source
         )
         painter.end()
         
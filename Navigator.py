@@ -0,0 +1,169 @@
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import QWidget, QListWidget, QListWidgetItem, QListView
+import math
+
+from VectorLayer import paintStrokes
+
+# Longest side of the low-resolution proxy, in pixels
+PROXY_SIZE = 256
+THUMBNAIL_SIZE = 48
+# Panels refresh once edits have paused for this long
+IDLE_REFRESH_MS = 150
+
+
+class ImageProxy:
+    """Low-resolution copy of the canvas, refreshed only where it changed"""
+
+    def __init__(self, image, strokes=()):
+        self.reset(image, strokes)
+
+    def reset(self, image, strokes=()):
+        """Rebuild the whole proxy, e.g. after the canvas size changed"""
+        self.sourceSize = image.size()
+        self.scale = min(1.0, PROXY_SIZE / max(image.width(), image.height()))
+        self.image = QImage(max(1, round(image.width() * self.scale)),
+                            max(1, round(image.height() * self.scale)),
+                            QImage.Format_RGB32)
+        self.update(image, image.rect(), strokes)
+
+    def update(self, image, rect, strokes=()):
+        """Downscale only the rect of image that changed into the proxy"""
+        rect = rect & image.rect()
+        if rect.isEmpty():
+            return
+
+        # Snap to whole proxy pixels so neighbouring updates line up
+        scale = self.scale
+        left, top = math.floor(rect.left() * scale), math.floor(rect.top() * scale)
+        right = math.ceil((rect.right() + 1) * scale)
+        bottom = math.ceil((rect.bottom() + 1) * scale)
+        target = QRect(left, top, right - left, bottom - top) & self.image.rect()
+        if target.isEmpty():
+            return
+        source = QRectF(target.x() / scale, target.y() / scale,
+                        target.width() / scale, target.height() / scale).toAlignedRect() & image.rect()
+
+        region = image.copy(source).convertToFormat(QImage.Format_RGB32)
+        region = region.scaled(target.size(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+        painter = QPainter(self.image)
+        painter.drawImage(target.topLeft(), region)
+        if strokes:
+            painter.setClipRect(target)
+            paintStrokes(painter, strokes, scale, QRectF(source))
+        painter.end()
+
+
+class NavigatorView(QWidget):
+    """Miniature of the whole canvas with the visible viewport outlined.
+
+    Clicking or dragging recenters the scroll area on that point.
+    """
+
+    def __init__(self, canvas, scroll_area, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.scroll_area = scroll_area
+        self.setFixedHeight(140)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(IDLE_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.update)
+
+        canvas.regionPublished.connect(self.refresh_timer.start)
+        scroll_area.horizontalScrollBar().valueChanged.connect(self.update)
+        scroll_area.verticalScrollBar().valueChanged.connect(self.update)
+
+    def proxyRect(self):
+        """Return where the proxy is drawn, fitted and centered in the widget"""
+        size = self.canvas.frontProxy.size().scaled(self.size(), Qt.KeepAspectRatio)
+        return QRect(QPoint((self.width() - size.width()) // 2,
+                            (self.height() - size.height()) // 2), size)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("#333333"))
+
+        target = self.proxyRect()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawImage(target, self.canvas.frontProxy)
+
+        width, height = self.canvas.getCanvasSize()
+        sx, sy = target.width() / width, target.height() / height
+        viewport = self.scroll_area.viewport()
+        visible = QRectF(self.scroll_area.horizontalScrollBar().value() * sx,
+                         self.scroll_area.verticalScrollBar().value() * sy,
+                         min(viewport.width(), width) * sx,
+                         min(viewport.height(), height) * sy)
+        painter.setPen(QPen(QColor("#ff5050"), 1))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(visible.translated(target.topLeft()))
+
+    def mousePressEvent(self, event):
+        self.centerOn(event.pos())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.centerOn(event.pos())
+
+    def centerOn(self, pos):
+        target = self.proxyRect()
+        if target.isEmpty():
+            return
+        width, height = self.canvas.getCanvasSize()
+        x = (pos.x() - target.left()) * width / target.width()
+        y = (pos.y() - target.top()) * height / target.height()
+        viewport = self.scroll_area.viewport()
+        self.scroll_area.horizontalScrollBar().setValue(int(x - viewport.width() / 2))
+        self.scroll_area.verticalScrollBar().setValue(int(y - viewport.height() / 2))
+
+
+class HistoryView(QListWidget):
+    """Thumbnail strip of the undo and redo steps; click one to jump to it"""
+
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.setViewMode(QListView.IconMode)
+        self.setFlow(QListView.LeftToRight)
+        self.setWrapping(False)
+        self.setMovement(QListView.Static)
+        self.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.setFixedHeight(THUMBNAIL_SIZE + 28)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(IDLE_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+        canvas.regionPublished.connect(self.refresh_timer.start)
+        self.itemClicked.connect(self.jumpTo)
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the strip from the proxies stored with each history entry"""
+        # The render thread appends to these lists, so work on copies
+        undo_proxies = [entry[2] for entry in list(self.canvas.undo_stack)]
+        redo_proxies = [entry[2] for entry in reversed(list(self.canvas.redo_stack))]
+        steps = ([(proxy, i - len(undo_proxies)) for i, proxy in enumerate(undo_proxies)] +
+                 [(self.canvas.frontProxy, 0)] +
+                 [(proxy, i + 1) for i, proxy in enumerate(redo_proxies)])
+
+        self.clear()
+        for proxy, offset in steps:
+            thumbnail = proxy.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE,
+                                     Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            item = QListWidgetItem(QIcon(QPixmap.fromImage(thumbnail)), "")
+            item.setData(Qt.UserRole, offset)
+            self.addItem(item)
+            if offset == 0:
+                self.setCurrentItem(item)
+                self.scrollToItem(item)
+
+    def jumpTo(self, item):
+        offset = item.data(Qt.UserRole)
+        step = self.canvas.undo if offset < 0 else self.canvas.redo
+        for _ in range(abs(offset)):
+            step()
@@ -0,0 +1,229 @@
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+import sys
+import threading
+
+from Exporter import write_png_streamed
+
+# Headless state for each warm worker process, created once by _init_worker
+_worker_app = None
+
+MAX_CANVAS_SIDE = 10000
+# Seconds a client waits for one job before it gets an error reply
+JOB_TIMEOUT = 300
+
+# Layout of "raw" replies per document format. RGB32 pixels are native-endian
+# 32-bit words; 1-bit rows are packed most significant bit first
+RAW_PIXEL_FORMATS = {
+    QImage.Format_RGB32: 'bgrx8888' if sys.byteorder == 'little' else 'xrgb8888',
+    QImage.Format_Grayscale8: 'gray8',
+    QImage.Format_Indexed8: 'indexed8',
+    QImage.Format_Mono: 'indexed1',
+}
+
+
+def _init_worker():
+    """Start Qt once per worker so jobs don't pay the startup cost"""
+    global _worker_app
+    # Ctrl+C is handled by the server process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    _worker_app = QApplication.instance() or QApplication([])
+    # Import here so the Canvas module is loaded before the first job arrives
+    import Canvas  # noqa: F401
+
+
+def _noop():
+    return None
+
+
+def _points(values):
+    return [QPoint(int(x), int(y)) for x, y in values]
+
+
+def _apply_operation(canvas, op):
+    """Apply one scripted operation to a headless Canvas"""
+    name = op.get('op')
+    if name == 'color':
+        canvas.brushColor = QColor(op['value'])
+    elif name == 'brush':
+        canvas.brushSize = int(op['size'])
+    elif name in ('line', 'erase'):
+        color = canvas.brushColor if name == 'line' else QColor(Qt.white)
+        canvas.drawStroke(_points(op['points']), color)
+    elif name == 'fill':
+        canvas.fill(QPoint(int(op['x']), int(op['y'])))
+    elif name == 'lasso':
+        canvas.lassoPoints = _points(op['points'])
+        canvas.processLassoSelection()
+        canvas.lassoPoints = []
+    elif name == 'clear':
+        canvas.image.fill(Qt.white)
+    else:
+        raise ValueError(f"Unknown operation: {name!r}")
+
+
+def render_job(job):
+    """Render a job in a worker process and return the response dict"""
+    from Canvas import Canvas, COLOR_MODES
+
+    width = int(job.get('width', 800))
+    height = int(job.get('height', 600))
+    if not (0 < width <= MAX_CANVAS_SIDE and 0 < height <= MAX_CANVAS_SIDE):
+        raise ValueError(f"Invalid canvas size: {width}x{height}")
+
+    mode = job.get('mode', 'rgb')
+    if mode not in COLOR_MODES:
+        raise ValueError(f"Unknown color mode: {mode!r}, expected one of {', '.join(COLOR_MODES)}")
+
+    canvas = Canvas(width=width, height=height, threaded=False)
+    canvas.setColorMode(mode)
+    for op in job.get('operations', []):
+        _apply_operation(canvas, op)
+
+    image_format = job.get('format', 'png').lower()
+    output = job.get('output')
+
+    if output:
+        if image_format == 'png':
+            ok = write_png_streamed(canvas.image, output)
+        else:
+            ok = canvas.image.save(output, image_format.upper(), int(job.get('quality', -1)))
+        if not ok:
+            raise IOError(f"Failed to write {output}")
+        return {'ok': True, 'path': output}
+
+    if image_format == 'raw':
+        image = canvas.image
+        response = {'ok': True, 'format': 'raw', 'width': width, 'height': height,
+                    'bytes_per_line': image.bytesPerLine(), 'mode': mode,
+                    'pixel_format': RAW_PIXEL_FORMATS[image.format()],
+                    'data': image.constBits().asstring(image.sizeInBytes())}
+        if image.colorTable():
+            # Indexed pixels are offsets into this list of colors
+            response['palette'] = [QColor(color).name() for color in image.colorTable()]
+        return response
+
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    if not canvas.image.save(buffer, image_format.upper(), int(job.get('quality', -1))):
+        raise ValueError(f"Unsupported format: {image_format!r}")
+    return {'ok': True, 'format': image_format, 'data': bytes(buffer.data())}
+
+
+class RenderRequestHandler(socketserver.StreamRequestHandler):
+    """Read newline-delimited JSON jobs from one client and answer each in turn.
+
+    Each response is a JSON line; if it has a "size" field, that many raw
+    bytes of image data follow it.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                response = self.server.submit(job)
+            except Exception as e:
+                response = {'ok': False, 'error': str(e)}
+
+            data = response.pop('data', None)
+            if data is not None:
+                response['size'] = len(data)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            if data is not None:
+                self.wfile.write(data)
+            self.wfile.flush()
+
+
+class RenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Local Unix-socket server dispatching render jobs to warm worker processes"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, workers=None, max_pending=None):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, RenderRequestHandler)
+        self.socket_path = socket_path
+        self.workers = workers or os.cpu_count() or 1
+
+        # Bounded number of jobs in flight; further clients block until a slot frees up
+        self.pending = threading.BoundedSemaphore(max_pending or self.workers * 4)
+
+        self.pool_lock = threading.Lock()
+        self.pool = self.start_pool()
+
+    def start_pool(self):
+        """Return a new pool with every worker already started"""
+        context = multiprocessing.get_context('spawn')
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                   initializer=_init_worker)
+        # Start every worker now instead of on the first job
+        for future in [pool.submit(_noop) for _ in range(self.workers)]:
+            future.result()
+        return pool
+
+    def restart_pool(self, broken):
+        """Replace a pool that lost a worker, unless another thread already did"""
+        with self.pool_lock:
+            if self.pool is broken:
+                broken.shutdown(wait=False)
+                self.pool = self.start_pool()
+
+    def submit(self, job):
+        # A worker that dies (crash, OOM kill) breaks the whole pool. Every
+        # job in flight then retries once on a fresh pool. A job that kills
+        # its worker twice fails on its own.
+        for attempt in range(2):
+            pool = self.pool
+            # The slot is held until the job finishes, even after a timeout
+            # reply, so slow jobs can't pile up behind the pool
+            self.pending.acquire()
+            try:
+                future = pool.submit(render_job, job)
+            except BrokenProcessPool:
+                self.pending.release()
+                self.restart_pool(pool)
+                continue
+            future.add_done_callback(lambda _: self.pending.release())
+            try:
+                return future.result(timeout=JOB_TIMEOUT)
+            except BrokenProcessPool:
+                self.restart_pool(pool)
+            except TimeoutError:
+                raise TimeoutError(f"Job did not finish within {JOB_TIMEOUT} s")
+        raise RuntimeError("Render worker crashed while running the job")
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def serve(socket_path, workers=None):
+    """Run the render server until interrupted or sent SIGTERM"""
+    server = RenderServer(socket_path, workers)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever to return, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"ArtBook-Lite render server listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
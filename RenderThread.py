@@ -0,0 +1,49 @@
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+import queue
+import traceback
+
+
+class RenderThread(QThread):
+    """Apply canvas commands in order, off the GUI thread.
+
+    A command is a callable that edits the canvas's working image and returns
+    the rect it changed, or None. After each command, even a failed one, the
+    canvas publishes its working image as the front buffer and `published`
+    carries the dirty rect to the GUI thread.
+    """
+
+    published = pyqtSignal(QRect)
+
+    def __init__(self, canvas):
+        super().__init__()
+        self.canvas = canvas
+        self.commands = queue.Queue()
+
+    def submit(self, command):
+        self.commands.put(command)
+
+    def stop(self):
+        """Finish the queued commands, then end the thread"""
+        self.commands.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            command = self.commands.get()
+            try:
+                if command is None:
+                    return
+                try:
+                    rect = command() or QRect()
+                except Exception:
+                    # A failed command must not take the canvas down with it. It
+                    # may have changed part of the image, so publish all of it
+                    traceback.print_exc()
+                    rect = self.canvas.image.rect()
+                self.canvas.publishFront(rect)
+                self.published.emit(rect)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.commands.task_done()
@@ -0,0 +1,79 @@
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from PIL import Image
+
+# Filters offered for scaling canvas content, by name
+RESAMPLE_FILTERS = {
+    "nearest": Image.NEAREST,
+    "bilinear": Image.BILINEAR,
+    "lanczos": Image.LANCZOS,
+}
+
+# Output tiles are resampled independently and committed one at a time
+TILE_SIZE = 512
+
+
+def toPillow(image):
+    """Return an RGB Pillow image holding a copy of a QImage's pixels"""
+    image = image.convertToFormat(QImage.Format_RGB32)
+    data = image.constBits().asstring(image.sizeInBytes())
+    return Image.frombuffer("RGB", (image.width(), image.height()), data,
+                            "raw", "BGRX", image.bytesPerLine(), 1)
+
+
+def fromPillow(image):
+    """Return an RGB32 QImage with a copy of an RGB Pillow image's pixels"""
+    data = image.tobytes("raw", "BGRX")
+    return QImage(data, image.width, image.height, image.width * 4, QImage.Format_RGB32).copy()
+
+
+def tileRects(width, height):
+    """Split a width×height output into TILE_SIZE tiles, row by row"""
+    return [QRect(x, y, min(TILE_SIZE, width - x), min(TILE_SIZE, height - y))
+            for y in range(0, height, TILE_SIZE)
+            for x in range(0, width, TILE_SIZE)]
+
+
+def resampleTile(source, rect, scale_x, scale_y, resample):
+    """Resample the part of source that lands on rect of the output.
+
+    The box is given in source coordinates, and Pillow reads the filter's
+    support from outside it, so adjacent tiles join without seams.
+    """
+    box = (rect.left() / scale_x, rect.top() / scale_y,
+           (rect.right() + 1) / scale_x, (rect.bottom() + 1) / scale_y)
+    return fromPillow(source.resize((rect.width(), rect.height()), resample, box))
+
+
+class Resample:
+    """Filtered resample of an image to width×height, computed in parallel tiles.
+
+    Pillow releases the GIL while resampling, so a thread pool keeps every
+    core busy without copying the source to other processes.
+    """
+
+    def __init__(self, width, height, resample_filter, max_workers=None):
+        self.width = width
+        self.height = height
+        self.resample = RESAMPLE_FILTERS[resample_filter]
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.rects = tileRects(width, height)
+        self.futures = []
+
+    def start(self, image):
+        """Start resampling every tile of image in the background"""
+        source = toPillow(image)
+        source.load()
+        scale_x, scale_y = self.width / image.width(), self.height / image.height()
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.futures = [pool.submit(resampleTile, source, rect, scale_x, scale_y, self.resample)
+                        for rect in self.rects]
+        # Queued tiles still run; the pool's threads exit once they are done
+        pool.shutdown(wait=False)
+
+    def tile(self, index):
+        """Block until tile index is resampled and return it"""
+        return self.futures[index].result()
@@ -0,0 +1,244 @@
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+from collections import OrderedDict
+
+TILE_SIZE = 256
+MAX_CACHED_TILES = 128
+
+# Maximum distance in canvas pixels a simplified stroke may stray from the input
+SIMPLIFY_TOLERANCE = 0.75
+# Points a curved span is flattened to when checking it against the input
+SPAN_SAMPLES = 16
+
+
+def segmentDistance(point, start, end):
+    """Distance from point to the segment start-end, all (x, y) tuples"""
+    (px, py), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if not length_sq else max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length_sq))
+    return ((px - x1 - t * dx) ** 2 + (py - y1 - t * dy) ** 2) ** 0.5
+
+
+def polylineDistance(point, polyline):
+    return min(segmentDistance(point, polyline[i], polyline[i + 1])
+               for i in range(len(polyline) - 1))
+
+
+def simplifyIndices(points, tolerance=SIMPLIFY_TOLERANCE):
+    """Douglas-Peucker simplification; return the indices of the kept points"""
+    if len(points) < 3:
+        return list(range(len(points)))
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            dist = segmentDistance(points[i], points[first], points[last])
+            if dist > max_dist:
+                max_dist, index = dist, i
+
+        if index is not None and max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+def simplifyPoints(points, tolerance=SIMPLIFY_TOLERANCE):
+    """Douglas-Peucker simplification of a list of (x, y) tuples"""
+    return [points[i] for i in simplifyIndices(points, tolerance)]
+
+
+def splineControls(points, i):
+    """Return the Bezier controls of the Catmull-Rom span from points[i] to points[i + 1]"""
+    (x0, y0) = points[max(i - 1, 0)]
+    (x1, y1), (x2, y2) = points[i], points[i + 1]
+    (x3, y3) = points[min(i + 2, len(points) - 1)]
+    return ((x1 + (x2 - x0) / 6, y1 + (y2 - y0) / 6),
+            (x2 - (x3 - x1) / 6, y2 - (y3 - y1) / 6))
+
+
+def flattenSpan(points, i):
+    """Return SPAN_SAMPLES + 1 points along the curved span starting at points[i]"""
+    (x1, y1), (x2, y2) = points[i], points[i + 1]
+    (ax, ay), (bx, by) = splineControls(points, i)
+    flat = []
+    for step in range(SPAN_SAMPLES + 1):
+        t = step / SPAN_SAMPLES
+        u = 1 - t
+        flat.append((u * u * u * x1 + 3 * u * u * t * ax + 3 * u * t * t * bx + t * t * t * x2,
+                     u * u * u * y1 + 3 * u * u * t * ay + 3 * u * t * t * by + t * t * t * y2))
+    return flat
+
+
+def straightSpans(samples, indices, tolerance=SIMPLIFY_TOLERANCE):
+    """Return the spans between kept samples that a curve would fit too loosely.
+
+    Each curved span is compared both ways with the input samples it
+    replaces. If it strays further than tolerance, for example by
+    overshooting a corner, the span is drawn as a straight line instead.
+    Douglas-Peucker already keeps that line within tolerance.
+    """
+    points = [samples[i] for i in indices]
+    straight = []
+    for span in range(len(points) - 1):
+        original = samples[indices[span]:indices[span + 1] + 1]
+        curve = flattenSpan(points, span)
+        if (max(polylineDistance(point, original) for point in curve) > tolerance or
+                max(polylineDistance(point, curve) for point in original) > tolerance):
+            straight.append(span)
+    return tuple(straight)
+
+
+def splinePath(points, straight=()):
+    """Fit a Catmull-Rom spline through the points as cubic Bezier segments.
+
+    Spans listed in straight are drawn as lines instead.
+    """
+    path = QPainterPath(QPointF(*points[0]))
+    for i in range(len(points) - 1):
+        if len(points) == 2 or i in straight:
+            path.lineTo(QPointF(*points[i + 1]))
+        else:
+            c1, c2 = splineControls(points, i)
+            path.cubicTo(QPointF(*c1), QPointF(*c2), QPointF(*points[i + 1]))
+    return path
+
+
+class VectorStroke:
+    """A simplified stroke with the brush it was drawn with"""
+
+    def __init__(self, points, color, size, straight=()):
+        self.points = tuple(points)
+        self.color = QColor(color)
+        self.size = size
+        self.straight = tuple(straight)
+        self.path = splinePath(self.points, self.straight)
+        margin = size / 2 + 1
+        self.bounds = self.path.boundingRect().adjusted(-margin, -margin, margin, margin)
+
+    def translated(self, dx, dy):
+        return VectorStroke([(x + dx, y + dy) for x, y in self.points], self.color, self.size,
+                            self.straight)
+
+    def scaled(self, sx, sy):
+        return VectorStroke([(x * sx, y * sy) for x, y in self.points], self.color,
+                            self.size * (sx + sy) / 2, self.straight)
+
+    def toDict(self):
+        return {'points': self.points, 'color': self.color.name(), 'size': self.size,
+                'straight': self.straight}
+
+    @staticmethod
+    def fromDict(data):
+        return VectorStroke(data['points'], data['color'], data['size'], data.get('straight', ()))
+
+
+def paintStrokes(painter, strokes, scale=1.0, clip=None):
+    """Paint strokes with antialiasing at the given scale.
+
+    clip is a rect in canvas coordinates; strokes outside it are skipped.
+    """
+    painter.save()
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setBrush(Qt.NoBrush)
+    painter.scale(scale, scale)
+    for stroke in strokes:
+        if clip is not None and not stroke.bounds.intersects(clip):
+            continue
+        painter.setPen(QPen(stroke.color, stroke.size,
+                            Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+        painter.drawPath(stroke.path)
+    painter.restore()
+
+
+class VectorLayer:
+    """Resolution-independent strokes rasterized lazily into cached tiles.
+
+    self.strokes is the render thread's working state. The GUI thread
+    paints the strokes of the published front state instead, passed to
+    paint(), and the tile cache only ever follows those. So the two threads
+    never share the cache.
+    """
+
+    def __init__(self):
+        self.strokes = ()
+        # Strokes the cached tiles were rendered from
+        self.tileStrokes = ()
+        # (scale, tile x, tile y) -> ARGB tile, least recently used first
+        self.tiles = OrderedDict()
+
+    def addStroke(self, points, color, size):
+        """Simplify and append a stroke; return its bounds in canvas coordinates"""
+        samples = [(p.x(), p.y()) for p in points]
+        indices = simplifyIndices(samples)
+        stroke = VectorStroke([samples[i] for i in indices], color, size,
+                              straightSpans(samples, indices))
+        self.setStrokes(self.strokes + (stroke,))
+        return stroke.bounds.toAlignedRect()
+
+    def setStrokes(self, strokes):
+        self.strokes = tuple(strokes)
+
+    def syncTiles(self, strokes):
+        """Switch the cache to strokes, dropping only the tiles whose strokes changed"""
+        if strokes is self.tileStrokes:
+            return
+        for stroke in set(self.tileStrokes) ^ set(strokes):
+            self.invalidate(stroke.bounds)
+        self.tileStrokes = strokes
+
+    def invalidate(self, rect):
+        """Drop cached tiles overlapping rect"""
+        for key in list(self.tiles):
+            scale, tx, ty = key
+            if self.tileRect(scale, tx, ty).intersects(rect):
+                del self.tiles[key]
+
+    def tileRect(self, scale, tx, ty):
+        """Return the canvas-space rect covered by a tile"""
+        side = TILE_SIZE / scale
+        return QRectF(tx * side, ty * side, side, side)
+
+    def tile(self, scale, tx, ty):
+        """Return a cached or freshly rendered tile of self.tileStrokes"""
+        key = (scale, tx, ty)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        image = QImage(TILE_SIZE, TILE_SIZE, QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        rect = self.tileRect(scale, tx, ty)
+        painter = QPainter(image)
+        painter.translate(-tx * TILE_SIZE, -ty * TILE_SIZE)
+        paintStrokes(painter, self.tileStrokes, scale, rect)
+        painter.end()
+
+        self.tiles[key] = image
+        if len(self.tiles) > MAX_CACHED_TILES:
+            self.tiles.popitem(last=False)
+        return image
+
+    def paint(self, painter, rect, strokes, scale=1.0):
+        """Paint the tiles of strokes covering rect, given in device pixels at scale"""
+        self.syncTiles(strokes)
+        if not strokes:
+            return
+        for ty in range(rect.top() // TILE_SIZE, rect.bottom() // TILE_SIZE + 1):
+            for tx in range(rect.left() // TILE_SIZE, rect.right() // TILE_SIZE + 1):
+                tile_rect = QRect(tx * TILE_SIZE, ty * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                if not any(stroke.bounds.intersects(self.tileRect(scale, tx, ty))
+                           for stroke in strokes):
+                    continue
+                area = tile_rect & rect
+                painter.drawImage(area, self.tile(scale, tx, ty),
+                                  area.translated(-tile_rect.topLeft()))
+
+    def toList(self):
+        return [stroke.toDict() for stroke in self.strokes]
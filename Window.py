@@ -4,10 +4,20 @@ from PyQt5.QtWidgets import (QMainWindow, QFileDialog, QApplication,
                             QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                             QLabel, QFrame, QColorDialog, QSlider, QButtonGroup,
                             QShortcut, QSizePolicy, QScrollArea, QDialog,
-                            QSpinBox, QDialogButtonBox, QGroupBox)
+                            QSpinBox, QDialogButtonBox, QGroupBox, QMessageBox,
+                            QComboBox, QCheckBox)
+
+import os
 
 from Canvas import Canvas
 from ImageHandler import ImageHandler, ImageImportDialog
+from Exporter import ExportDialog, ExportThread, shutdown_pool
+from Navigator import NavigatorView, HistoryView
+import math
+
+# Side lengths accepted by the canvas size dialogs, in pixels
+MIN_CANVAS_SIDE = 50
+MAX_CANVAS_SIDE = 3000
 
 class CanvasSizeDialog(QDialog):
     """Dialog for changing canvas size"""
@@ -22,7 +32,7 @@ class CanvasSizeDialog(QDialog):
         width_layout = QHBoxLayout()
         width_layout.addWidget(QLabel("Width:"))
         self.width_spin = QSpinBox()
-        self.width_spin.setRange(50, 3000)
+        self.width_spin.setRange(MIN_CANVAS_SIDE, MAX_CANVAS_SIDE)
         self.width_spin.setValue(current_width)
         self.width_spin.setSuffix(" px")
         width_layout.addWidget(self.width_spin)
@@ -32,7 +42,7 @@ class CanvasSizeDialog(QDialog):
         height_layout = QHBoxLayout()
         height_layout.addWidget(QLabel("Height:"))
         self.height_spin = QSpinBox()
-        self.height_spin.setRange(50, 3000)
+        self.height_spin.setRange(MIN_CANVAS_SIDE, MAX_CANVAS_SIDE)
         self.height_spin.setValue(current_height)
         self.height_spin.setSuffix(" px")
         height_layout.addWidget(self.height_spin)
@@ -68,6 +78,91 @@ class CanvasSizeDialog(QDialog):
     def get_canvas_size(self):
         return (self.width_spin.value(), self.height_spin.value())
 
+class ImageSizeDialog(QDialog):
+    """Dialog for scaling the canvas content"""
+    def __init__(self, parent=None, current_width=800, current_height=600):
+        super().__init__(parent)
+        self.setWindowTitle("Image Size")
+        self.aspect = current_width / current_height
+
+        layout = QVBoxLayout(self)
+
+        # Width input
+        width_layout = QHBoxLayout()
+        width_layout.addWidget(QLabel("Width:"))
+        self.width_spin = QSpinBox()
+        self.width_spin.setSuffix(" px")
+        self.width_spin.valueChanged.connect(self.on_width_changed)
+        width_layout.addWidget(self.width_spin)
+        layout.addLayout(width_layout)
+
+        # Height input
+        height_layout = QHBoxLayout()
+        height_layout.addWidget(QLabel("Height:"))
+        self.height_spin = QSpinBox()
+        self.height_spin.setSuffix(" px")
+        self.height_spin.valueChanged.connect(self.on_height_changed)
+        height_layout.addWidget(self.height_spin)
+        layout.addLayout(height_layout)
+
+        self.aspect_check = QCheckBox("Maintain aspect ratio")
+        self.aspect_check.setChecked(True)
+        self.aspect_check.stateChanged.connect(self.on_aspect_changed)
+        layout.addWidget(self.aspect_check)
+        self.update_ranges()
+        self.width_spin.setValue(current_width)
+        self.height_spin.setValue(current_height)
+
+        # Resampling filter
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Resample:"))
+        self.filter_combo = QComboBox()
+        for name, resample_filter in [("Lanczos (best)", "lanczos"),
+                                      ("Bilinear", "bilinear"),
+                                      ("Nearest Neighbor (hard edges)", "nearest")]:
+            self.filter_combo.addItem(name, resample_filter)
+        filter_layout.addWidget(self.filter_combo)
+        layout.addLayout(filter_layout)
+
+        # Dialog buttons
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def update_ranges(self):
+        """Limit each side so that, with the aspect ratio locked, the other stays in range"""
+        width_range = height_range = (MIN_CANVAS_SIDE, MAX_CANVAS_SIDE)
+        if self.aspect_check.isChecked():
+            width_range = (max(MIN_CANVAS_SIDE, math.ceil(MIN_CANVAS_SIDE * self.aspect)),
+                           min(MAX_CANVAS_SIDE, math.floor(MAX_CANVAS_SIDE * self.aspect)))
+            height_range = (max(MIN_CANVAS_SIDE, math.ceil(MIN_CANVAS_SIDE / self.aspect)),
+                            min(MAX_CANVAS_SIDE, math.floor(MAX_CANVAS_SIDE / self.aspect)))
+        for spin, (low, high) in ((self.width_spin, width_range), (self.height_spin, height_range)):
+            spin.blockSignals(True)
+            spin.setRange(low, high)
+            spin.blockSignals(False)
+
+    def on_aspect_changed(self, state):
+        self.update_ranges()
+        self.on_width_changed(self.width_spin.value())
+
+    def on_width_changed(self, value):
+        if self.aspect_check.isChecked():
+            self.height_spin.blockSignals(True)
+            self.height_spin.setValue(round(value / self.aspect))
+            self.height_spin.blockSignals(False)
+
+    def on_height_changed(self, value):
+        if self.aspect_check.isChecked():
+            self.width_spin.blockSignals(True)
+            self.width_spin.setValue(round(value * self.aspect))
+            self.width_spin.blockSignals(False)
+
+    def get_image_size(self):
+        return (self.width_spin.value(), self.height_spin.value(),
+                self.filter_combo.currentData())
+
 class Window(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -189,7 +284,28 @@ class Window(QMainWindow):
             }
         """)
         tools_panel.setFixedWidth(220)
-        main_layout.addWidget(tools_panel)
+
+        # Scroll the tools vertically so the window fits on small screens
+        tools_scroll = QScrollArea()
+        tools_scroll.setWidgetResizable(True)
+        tools_scroll.setFrameShape(QFrame.NoFrame)
+        tools_scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        tools_scroll.setStyleSheet("""
+            QScrollArea {
+                background-color: #3a3a3a;
+            }
+            QScrollBar {
+                background-color: #444444;
+                width: 12px;
+            }
+            QScrollBar::handle {
+                background-color: #666666;
+                border-radius: 4px;
+            }
+        """)
+        tools_scroll.setWidget(tools_panel)
+        tools_scroll.setFixedWidth(220 + 14)
+        main_layout.addWidget(tools_scroll)
 
         # Tools layout
         tools_layout = QVBoxLayout(tools_panel)
@@ -214,11 +330,31 @@ class Window(QMainWindow):
         resize_canvas_btn = QPushButton("Resize Canvas")
         resize_canvas_btn.clicked.connect(self.showResizeCanvasDialog)
         tools_layout.addWidget(resize_canvas_btn)
+
+        image_size_btn = QPushButton("Image Size")
+        image_size_btn.clicked.connect(self.showImageSizeDialog)
+        tools_layout.addWidget(image_size_btn)
         
         # Display current canvas size
         self.canvas_size_label = QLabel(f"Size: {self.canvas.canvas_width}×{self.canvas.canvas_height} px")
         self.canvas_size_label.setStyleSheet("color: #c0c0c0; font-size: 12px;")
         tools_layout.addWidget(self.canvas_size_label)
+        self.canvas.sizeChanged.connect(self.updateCanvasSizeLabel)
+
+        # Document color mode
+        self.color_mode_combo = QComboBox()
+        color_modes = [
+            ("RGB", "rgb"),
+            ("Grayscale", "grayscale"),
+            ("Line Art (1-bit)", "lineart"),
+            ("Indexed (16 colors)", "indexed")
+        ]
+        for name, mode in color_modes:
+            self.color_mode_combo.addItem(name, mode)
+        self.color_mode_combo.setStyleSheet("color: #e0e0e0; background-color: #505050; padding: 4px;")
+        self.color_mode_combo.currentIndexChanged.connect(self.setColorMode)
+        self.canvas.colorModeChanged.connect(self.syncColorMode)
+        tools_layout.addWidget(self.color_mode_combo)
 
         # File operations
         file_label = QLabel("File Operations")
@@ -229,6 +365,14 @@ class Window(QMainWindow):
         save_btn.clicked.connect(self.save)
         tools_layout.addWidget(save_btn)
 
+        self.export_btn = QPushButton("Export (Ctrl+E)")
+        self.export_btn.clicked.connect(self.exportImage)
+        tools_layout.addWidget(self.export_btn)
+        # Export settings waiting for a canvas snapshot, then the export running
+        self.export_config = None
+        self.export_thread = None
+        self.canvas.snapshotTaken.connect(self.startExport)
+
         # Import image button
         import_btn = QPushButton("Import Image")
         import_btn.clicked.connect(self.importImage)
@@ -260,6 +404,10 @@ class Window(QMainWindow):
 
         tools_layout.addLayout(undo_redo_layout)
 
+        self.history_view = HistoryView(self.canvas)
+        self.history_view.setStyleSheet("background-color: #3a3a3a; border: 1px solid #333333;")
+        tools_layout.addWidget(self.history_view)
+
         # Drawing tools
         tools_label = QLabel("Drawing Tools")
         tools_label.setStyleSheet(section_style)
@@ -271,7 +419,10 @@ class Window(QMainWindow):
             ("Pencil", "pencil"),
             ("Eraser", "eraser"),
             ("Fill", "fill"),
-            ("Lasso", "lasso")
+            ("Lasso", "lasso"),
+            ("Line", "line"),
+            ("Rectangle", "rect"),
+            ("Ellipse", "ellipse")
         ]
 
         for name, tool_id in tools:
@@ -282,6 +433,13 @@ class Window(QMainWindow):
             tools_layout.addWidget(btn)
             btn.clicked.connect(lambda _, t=tool_id: self.setTool(t))
 
+        vector_check = QCheckBox("Vector pencil strokes")
+        vector_check.setStyleSheet("color: #e0e0e0; font-weight: normal;")
+        vector_check.setToolTip("Keep pencil strokes as curves so exports stay sharp at any scale.\n"
+                                "Other tools turn existing curves into pixels first.")
+        vector_check.toggled.connect(self.setVectorMode)
+        tools_layout.addWidget(vector_check)
+
         # Brush size
         size_label = QLabel("Brush Size")
         size_label.setStyleSheet(section_style)
@@ -317,6 +475,14 @@ class Window(QMainWindow):
         custom_color_btn.clicked.connect(self.chooseCustomColor)
         tools_layout.addWidget(custom_color_btn)
 
+        # Navigator
+        navigator_label = QLabel("Navigator")
+        navigator_label.setStyleSheet(section_style)
+        tools_layout.addWidget(navigator_label)
+
+        self.navigator = NavigatorView(self.canvas, self.scroll_area)
+        tools_layout.addWidget(self.navigator)
+
         # Add stretch to push all content up
         tools_layout.addStretch()
 
@@ -327,9 +493,18 @@ class Window(QMainWindow):
         QShortcut(QKeySequence("Ctrl+Z"), self).activated.connect(self.canvas.undo)
         QShortcut(QKeySequence("Ctrl+Shift+Z"), self).activated.connect(self.canvas.redo)
         QShortcut(QKeySequence("Ctrl+S"), self).activated.connect(self.save)
+        QShortcut(QKeySequence("Ctrl+E"), self).activated.connect(self.exportImage)
         QShortcut(QKeySequence("Ctrl+C"), self).activated.connect(self.clearCanvas)
         QShortcut(QKeySequence("Ctrl+I"), self).activated.connect(self.importImage)
         QShortcut(QKeySequence("Ctrl+R"), self).activated.connect(self.showResizeCanvasDialog)
+        QShortcut(QKeySequence("Ctrl+Alt+I"), self).activated.connect(self.showImageSizeDialog)
+
+    def closeEvent(self, event):
+        self.canvas.stopRendering()
+        if self.export_thread is not None:
+            self.export_thread.wait()
+        shutdown_pool()
+        super().closeEvent(event)
 
     def updateSizeIndicator(self, size):
         self.size_indicator.setText(f"Size: {size}px")
@@ -341,6 +516,18 @@ class Window(QMainWindow):
     def setTool(self, tool):
         self.canvas.currentTool = tool
 
+    def setVectorMode(self, enabled):
+        self.canvas.vectorMode = enabled
+
+    def setColorMode(self, index):
+        self.canvas.setColorMode(self.color_mode_combo.itemData(index))
+
+    def syncColorMode(self, mode):
+        """Show the document's color mode without converting it again"""
+        self.color_mode_combo.blockSignals(True)
+        self.color_mode_combo.setCurrentIndex(self.color_mode_combo.findData(mode))
+        self.color_mode_combo.blockSignals(False)
+
     def updateColorPreview(self):
         self.color_preview.setStyleSheet(f"background-color: {self.canvas.brushColor.name()};")
 
@@ -348,7 +535,47 @@ class Window(QMainWindow):
         filePath, _ = QFileDialog.getSaveFileName(self, "Save Image", "",
                                                  "PNG(*.png);;JPEG(*.jpg *.jpeg);;All Files(*.*)")
         if filePath:
-            self.canvas.image.save(filePath)
+            self.canvas.flattenedImage().save(filePath)
+
+    def exportImage(self):
+        """Export the canvas to several files at once, in the background"""
+        if self.export_config is not None or self.export_thread is not None:
+            QMessageBox.information(self, "Export", "An export is already running.")
+            return
+
+        dialog = ExportDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+
+        config = dialog.get_export_config()
+        if not os.path.isdir(config['directory']):
+            QMessageBox.critical(self, "Error", "Export folder does not exist.")
+            return
+
+        # Export the document as it is once the queued edits are applied
+        self.export_config = config
+        self.export_btn.setEnabled(False)
+        self.export_btn.setText("Exporting…")
+        self.canvas.requestSnapshot()
+
+    def startExport(self, image, strokes):
+        if self.export_config is None:
+            return
+        config, self.export_config = self.export_config, None
+        self.export_thread = ExportThread(image, config, [stroke.toDict() for stroke in strokes], self)
+        self.export_thread.finished.connect(self.exportFinished)
+        self.export_thread.start()
+
+    def exportFinished(self):
+        thread, self.export_thread = self.export_thread, None
+        self.export_btn.setEnabled(True)
+        self.export_btn.setText("Export (Ctrl+E)")
+
+        presets = thread.config['presets']
+        if thread.error is not None:
+            QMessageBox.critical(self, "Error", f"Export failed: {thread.error}")
+        elif len(thread.paths) != len(presets):
+            QMessageBox.warning(self, "Export", f"Exported {len(thread.paths)} of {len(presets)} files.")
 
     def chooseCustomColor(self):
         color = QColorDialog.getColor(self.canvas.brushColor, self, "Select Brush Color")
@@ -356,6 +583,9 @@ class Window(QMainWindow):
             self.canvas.brushColor = color
             self.updateColorPreview()
             
+    def updateCanvasSizeLabel(self, width, height):
+        self.canvas_size_label.setText(f"Size: {width}×{height} px")
+
     def showResizeCanvasDialog(self):
         """Show dialog to resize canvas"""
         current_width, current_height = self.canvas.getCanvasSize()
@@ -364,8 +594,16 @@ class Window(QMainWindow):
         if dialog.exec_() == QDialog.Accepted:
             new_width, new_height = dialog.get_canvas_size()
             self.canvas.setCanvasSize(new_width, new_height)
-            self.canvas_size_label.setText(f"Size: {new_width}×{new_height} px")
     
+    def showImageSizeDialog(self):
+        """Show dialog to scale the canvas content"""
+        current_width, current_height = self.canvas.getCanvasSize()
+        dialog = ImageSizeDialog(self, current_width, current_height)
+
+        if dialog.exec_() == QDialog.Accepted:
+            new_width, new_height, resample_filter = dialog.get_image_size()
+            self.canvas.scaleImage(new_width, new_height, resample_filter)
+
     def importImage(self):
         """Import an image onto the canvas"""
         # Get image file path
@@ -373,9 +611,8 @@ class Window(QMainWindow):
         if not image_path:
             return
             
-        # Load the image
-        image = ImageHandler.load_image(image_path)
-        if image is None:
+        # Check the image from its header; it is decoded on the render thread
+        if ImageHandler.image_size(image_path) is None:
             QMessageBox.critical(self, "Error", "Failed to load image.")
             return
             
@@ -386,13 +623,7 @@ class Window(QMainWindow):
         if dialog.exec_() == QDialog.Accepted:
             config = dialog.get_import_config()
             
-            # Scale the image
-            scaled_image = ImageHandler.scale_image(
-                image, 
-                config['width'], 
-                config['height'], 
-                config['maintain_aspect']
-            )
-            
-            # Add to canvas
-            self.canvas.addImage(scaled_image, config['x'], config['y'])
+            # Decode, scale and add to the canvas without blocking the UI
+            self.canvas.addImageFile(config['path'], config['x'], config['y'],
+                                     config['width'], config['height'],
+                                     config['maintain_aspect'])
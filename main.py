@@ -4,13 +4,25 @@ from PyQt5.QtWidgets import (QMainWindow, QFileDialog, QApplication,
                             QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                             QLabel, QFrame, QColorDialog, QSlider, QButtonGroup,
                             QShortcut, QSizePolicy)
+import argparse
 
 from Canvas import Canvas
 from Window import Window
 
 
 if __name__ == "__main__":
-    App = QApplication([])
-    window = Window()
-    window.show()
-    App.exec()
+    parser = argparse.ArgumentParser(description="ArtBook-Lite")
+    parser.add_argument("--serve", metavar="SOCKET",
+                        help="run as a headless render server on a Unix socket")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of render worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.serve:
+        from RenderServer import serve
+        serve(args.serve, args.workers)
+    else:
+        App = QApplication([])
+        window = Window()
+        window.show()
+        App.exec()